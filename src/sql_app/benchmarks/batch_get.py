@@ -0,0 +1,111 @@
+"""
+GET /users/{user_id} を ID ごとに呼び出すファンアウトと、
+GET /users/batch, GET /items/batch でまとめて取得する場合の処理時間を比較する。
+
+実行方法 (リポジトリのルートで):
+    python -m src.sql_app.benchmarks.batch_get
+"""
+import argparse
+import secrets
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import models
+from ..database import Base
+from ..main import app, get_db
+
+
+def seed(session_factory, n_users: int, items_per_user: int):
+    """ベンチマーク用のユーザと Item を作成し、先頭ユーザのトークンを返す。"""
+    db = session_factory()
+    try:
+        users = [
+            models.User(
+                email=f"bench{i}@example.com",
+                hashed_password="notreallyhashed",
+                is_active=True,
+                token=secrets.token_hex(16),
+            )
+            for i in range(n_users)
+        ]
+        db.add_all(users)
+        db.flush()
+        db.add_all(
+            models.Item(title=f"Task {user.id}-{j}", owner_id=user.id)
+            for user in users
+            for j in range(items_per_user)
+        )
+        db.commit()
+        return users[0].token
+    finally:
+        db.close()
+
+
+def measure(func, repeat: int):
+    """func を repeat 回実行し、1回あたりの平均時間 (ミリ秒) を返す。"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="作成するユーザ数 (バッチ1回分の ID 数)")
+    parser.add_argument("--items-per-user", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_engine(
+            f"sqlite:///{Path(tmpdir) / 'bench.db'}", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=engine)
+        BenchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        def override_get_db():
+            db = BenchSessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        try:
+            token = seed(BenchSessionLocal, args.users, args.items_per_user)
+            headers = {"X-API-TOKEN": token}
+            user_ids = list(range(1, args.users + 1))
+            item_ids = list(range(1, args.users + 1))
+            client = TestClient(app)
+
+            def fan_out():
+                for user_id in user_ids:
+                    client.get(f"/users/{user_id}", headers=headers)
+
+            def users_batch():
+                client.get("/users/batch", params={"ids": user_ids}, headers=headers)
+
+            def items_batch():
+                client.get("/items/batch", params={"ids": item_ids}, headers=headers)
+
+            results = [
+                (f"GET /users/{{id}} x {args.users}", measure(fan_out, args.repeat)),
+                (f"GET /users/batch ({args.users} ids)", measure(users_batch, args.repeat)),
+                (f"GET /items/batch ({args.users} ids)", measure(items_batch, args.repeat)),
+            ]
+        finally:
+            app.dependency_overrides.pop(get_db, None)
+            engine.dispose()
+
+    # TestClient はプロセス内で呼び出すため、ネットワーク往復の分だけ実環境のファンアウトはさらに遅くなる
+    for name, elapsed in results:
+        print(f"{name:<32} {elapsed:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
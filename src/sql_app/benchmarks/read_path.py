@@ -0,0 +1,87 @@
+"""
+一覧取得の ORM 版 (db.query(models.Item)) と、queries.py の Core 版の
+処理時間とメモリ使用量 (tracemalloc のピーク) を比較する。
+どちらも取得結果を schemas.Item に変換するところまでを計測する。
+
+実行方法 (リポジトリのルートで):
+    python -m src.sql_app.benchmarks.read_path
+"""
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from .. import models, queries, schemas
+from ..database import Base
+
+
+def orm_get_items(db, skip: int = 0, limit: int = 100):
+    return db.query(models.Item).order_by(models.Item.id).limit(limit).offset(skip).all()
+
+
+def seed(engine, n_items: int):
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"email": "bench@example.com", "hashed_password": "notreallyhashed", "token": "bench", "is_active": True}
+        ])
+        conn.execute(insert(models.Item), [
+            {"title": f"Task {i}", "description": f"description {i}", "owner_id": 1} for i in range(n_items)
+        ])
+
+
+def run(session_factory, get_items, limit: int):
+    db = session_factory()
+    try:
+        return [schemas.Item.model_validate(item) for item in get_items(db, skip=0, limit=limit)]
+    finally:
+        db.close()
+
+
+def measure(session_factory, get_items, limit: int, repeat: int):
+    """1回あたりの平均時間 (ミリ秒) と、1回分のメモリ確保のピーク (KiB) を返す。"""
+    run(session_factory, get_items, limit)  # ウォームアップ
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run(session_factory, get_items, limit)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+
+    gc.collect()
+    tracemalloc.start()
+    run(session_factory, get_items, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="1ページで取得する件数")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_engine(f"sqlite:///{Path(tmpdir) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        seed(engine, args.rows)
+        BenchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        try:
+            results = [
+                ("ORM (db.query)", measure(BenchSessionLocal, orm_get_items, args.rows, args.repeat)),
+                ("Core (queries.get_items)", measure(BenchSessionLocal, queries.get_items, args.rows, args.repeat)),
+            ]
+        finally:
+            engine.dispose()
+
+    print(f"{args.rows} rows / page")
+    for name, (elapsed, peak) in results:
+        print(f"{name:<26} {elapsed:10.2f} ms {peak:12.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
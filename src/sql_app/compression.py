@@ -0,0 +1,185 @@
+"""
+レスポンスを Accept-Encoding に応じて圧縮する ASGI ミドルウェア。
+
+gzip は標準ライブラリで常に利用できる。brotli (br) と zstd は、それぞれ
+`brotli` / `zstandard` パッケージがインストールされている場合のみ利用する
+(`poetry install --extras compression` でインストールされる)。
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli は任意の依存関係
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard は任意の依存関係
+    zstandard = None
+
+
+# 同じ q 値のときに優先するエンコーディングの順
+SUPPORTED_ENCODINGS = [
+    name
+    for name, available in (("zstd", zstandard is not None), ("br", brotli is not None), ("gzip", True))
+    if available
+]
+
+DEFAULT_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Accept-Encoding ヘッダから、利用可能なエンコーディングのうち q 値が最も高いものを選ぶ。
+    該当するものがなければ None を返す。
+    """
+    qualities = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    minimum_size バイト以上のレスポンスを圧縮する。
+
+    - levels: エンコーディングごとの既定の圧縮レベル
+    - route_levels: パスの前方一致でエンコーディングごとの圧縮レベルを上書きする
+      (例: {"/items/": {"gzip": 9}})。最も長く一致したものを使う。
+    - cache_size: 圧縮結果をキャッシュする件数。本文のハッシュをキーにするため、
+      同じ内容のポーリングは再圧縮しない。ETag は URL ごとにしか一意でなく、
+      別のパスやユーザのレスポンスと重複しうるためキーには使わない。
+    - threadpool_min_size: このバイト数以上の本文はスレッドプールで圧縮する。
+      大きな本文の圧縮はミリ秒単位で CPU を使うため、イベントループ上で行うと他のリクエストが止まる。
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        levels: Optional[Dict[str, int]] = None,
+        route_levels: Optional[Dict[str, Dict[str, int]]] = None,
+        cache_size: int = 256,
+        threadpool_min_size: int = 64 * 1024,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        # 長いプレフィックスから順に照合する
+        self.route_levels = sorted((route_levels or {}).items(), key=lambda kv: len(kv[0]), reverse=True)
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.threadpool_min_size = threadpool_min_size
+
+    def level_for(self, path: str, encoding: str) -> int:
+        for prefix, levels in self.route_levels:
+            if path.startswith(prefix) and encoding in levels:
+                return levels[encoding]
+        return self.levels[encoding]
+
+    def compress_cached(self, body: bytes, encoding: str, level: int) -> bytes:
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding, level)
+        with self.cache_lock:
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                self.cache.move_to_end(key)
+                return compressed
+
+        # 圧縮中はロックを保持しない (別スレッドの圧縮を待たせないため)
+        compressed = compress(body, encoding, level)
+        if self.cache_size > 0:
+            with self.cache_lock:
+                self.cache[key] = compressed
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return compressed
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        body_parts = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or headers.get("content-type", "").startswith("text/event-stream"):
+                    # 圧縮済み、またはストリーミング前提のレスポンスはそのまま返す
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            # JSON レスポンスは本文が小さいため、まとめてから圧縮するか判断する
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(body_parts)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if len(body) >= self.minimum_size:
+                level = self.level_for(scope["path"], encoding)
+                etag = headers.get("etag")
+                if len(body) >= self.threadpool_min_size:
+                    body = await run_in_threadpool(self.compress_cached, body, encoding, level)
+                else:
+                    body = self.compress_cached(body, encoding, level)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                if etag and not etag.startswith("W/"):
+                    # 表現ごとに異なる強い ETag にする
+                    headers["etag"] = f'{etag[:-1]}-{encoding}"'
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,5 +1,8 @@
 import secrets
-from sqlalchemy.orm import Session
+from typing import List
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session, selectinload
 
 from . import models, schemas
 
@@ -13,8 +16,28 @@ def get_user_by_email(db: Session, email: str):
 def get_user_by_token(db: Session, token: str):
     return db.query(models.User).filter(models.User.token == token).first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def _order_by_ids(rows, ids: List[int]):
+    """
+    IN クエリの結果を入力された ID の順に並べ直し、見つからなかった ID を返す。
+    """
+    found = {row.id: row for row in rows}
+    ordered = [found[i] for i in ids if i in found]
+    missing_ids = [i for i in ids if i not in found]
+    return ordered, missing_ids
+
+def get_users_by_ids(db: Session, user_ids: List[int]):
+    """
+    指定した ID のユーザを1回の IN クエリでまとめて取得する。
+    戻り値は (入力順に並べたユーザのリスト, 見つからなかった ID のリスト)。
+    """
+    ids = list(dict.fromkeys(user_ids))  # 重複を除きつつ入力順を保つ
+    users = (
+        db.query(models.User)
+        .options(selectinload(models.User.items))  # items をユーザごとに遅延ロードしない
+        .filter(models.User.id.in_(ids))
+        .all()
+    )
+    return _order_by_ids(users, ids)
 
 def create_user(db: Session, user: schemas.UserCreate):
     fake_hashed_password = user.password + "notreallyhashed"
@@ -30,12 +53,14 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).order_by(models.Item.id).limit(limit).offset(skip).all()
-
-
-def get_items_for_user(db: Session, user_id:int, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).filter(models.Item.owner_id == user_id).offset(skip).limit(limit).all()
+def get_items_by_ids(db: Session, item_ids: List[int]):
+    """
+    指定した ID の Item を1回の IN クエリでまとめて取得する。
+    戻り値は (入力順に並べた Item のリスト, 見つからなかった ID のリスト)。
+    """
+    ids = list(dict.fromkeys(item_ids))  # 重複を除きつつ入力順を保つ
+    items = db.query(models.Item).filter(models.Item.id.in_(ids)).all()
+    return _order_by_ids(items, ids)
 
 
 def create_user_item(db: Session, item: schemas.ItemCreate, user_id: int):
@@ -46,43 +71,123 @@ def create_user_item(db: Session, item: schemas.ItemCreate, user_id: int):
     return db_item
 
 
-def deactivate_user_and_reassign_items(db: Session, user_id: int):
+def get_job(db: Session, job_id: int):
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+
+def get_unfinished_jobs(db: Session):
+    return (
+        db.query(models.Job)
+        .filter(models.Job.status.in_(["pending", "running"]))
+        .order_by(models.Job.id)
+        .all()
+    )
+
+
+def claim_job(db: Session, job_id: int, worker_id: str, now: float, stale_before: float):
+    """
+    ジョブを worker_id の担当にして running にし、担当できたかを返す。コミットは呼び出し側で行う。
+    pending のジョブと、担当のワーカーが stale_before 以降に進捗を記録していない running のジョブのみ担当できる。
+    """
+    claimable = or_(
+        models.Job.status == "pending",
+        and_(
+            models.Job.status == "running",
+            or_(models.Job.claimed_at.is_(None), models.Job.claimed_at < stale_before),
+        ),
+    )
+    count = (
+        db.query(models.Job)
+        .filter(models.Job.id == job_id, claimable)
+        .update({"status": "running", "claimed_by": worker_id, "claimed_at": now}, synchronize_session=False)
+    )
+    return count == 1
+
+
+def update_claimed_job(db: Session, job_id: int, worker_id: str, now: float, processed: int = 0, **values):
+    """
+    worker_id が担当しているジョブの処理済み件数に processed を加算し、values の列を更新する。
+    担当が他のワーカーに移っている場合は何もせず False を返す。コミットは呼び出し側で行う。
+    """
+    count = (
+        db.query(models.Job)
+        .filter(models.Job.id == job_id, models.Job.claimed_by == worker_id)
+        .update(
+            {"processed": models.Job.processed + processed, "claimed_at": now, **values},
+            synchronize_session=False,
+        )
+    )
+    return count == 1
+
+
+def is_active_user(db: Session, user_id: int):
+    return db.query(models.User.id).filter(models.User.id == user_id, models.User.is_active == True).first() is not None
+
+
+def get_reassign_target(db: Session, user_id: int):
+    """
+    user_id の Item の移行先となる「最も ID が小さい他の有効なユーザ」を返す。いなければ None。
+    """
+    return (
+        db.query(models.User)
+        .filter(models.User.is_active == True, models.User.id != user_id)
+        .order_by(models.User.id.asc())
+        .first()
+    )
+
+
+def deactivate_user_and_create_reassign_job(db: Session, user_id: int):
     """
     指定のユーザを無効化し、そのユーザが所有していた Item を
-    最も ID が小さい他の有効なユーザに移行する。
+    最も ID が小さい他の有効なユーザに移行するジョブを作成する。
+    Item の移行自体は jobs.run_job でチャンクごとに行う。
+    戻り値は (ユーザ, ジョブ)。ユーザが存在しない場合は (None, None)、
+    すでに非アクティブな場合は (ユーザ, None) を返す。
     """
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if not db_user:
-        # ユーザが存在しない場合
-        return None
+        return None, None
 
-    # すでに非アクティブなら何もしない
     if db_user.is_active is False:
-        return db_user
-    else:
-        # ユーザを無効化
-        db_user.is_active = False
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-
-        # 「最も ID が小さい有効ユーザ」を検索する
-        new_owner = (
-            db.query(models.User)
-            .filter(models.User.is_active == True, models.User.id != user_id)
-            .order_by(models.User.id.asc())
-            .first()
-        )
+        return db_user, None
+
+    new_owner = get_reassign_target(db, user_id)
+
+    # 無効化とジョブの登録を同じトランザクションで行い、再起動後もジョブから再開できるようにする
+    db_user.is_active = False
+    db_job = models.Job(
+        kind="reassign_items",
+        status="pending",
+        user_id=user_id,
+        new_owner_id=new_owner.id if new_owner else None,
+        processed=0,
+    )
+    db.add(db_user)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_user)
+    db.refresh(db_job)
+    return db_user, db_job
 
-        if not new_owner:
-            new_owner_id = None # 有効なユーザーがいないときは、owner_idをNULLにする
-        else:
-            new_owner_id = new_owner.id
 
-        # アイテム所有権を new_owner に移す
-        db.query(models.Item).filter(models.Item.owner_id == user_id).update(
-            {"owner_id": new_owner_id}
+def reassign_items_chunk(db: Session, user_id: int, new_owner_id, chunk_size: int):
+    """
+    user_id が所有する Item のうち最大 chunk_size 件の所有者を new_owner_id に変更し、
+    変更した件数を返す。コミットは呼び出し側で行う。
+    new_owner_id のユーザが無効化されている場合は何も変更せず 0 を返す。
+    """
+    chunk_ids = (
+        select(models.Item.id)
+        .where(models.Item.owner_id == user_id)
+        .order_by(models.Item.id)
+        .limit(chunk_size)
+    )
+    query = db.query(models.Item).filter(models.Item.id.in_(chunk_ids))
+    if new_owner_id is not None:
+        # 移行先の有効チェックを UPDATE と同じ文で行い、チェック後に無効化された場合も移行しない
+        query = query.filter(
+            select(models.User.id)
+            .where(models.User.id == new_owner_id, models.User.is_active == True)
+            .exists()
         )
-        db.commit()
-
-        return db_user
\ No newline at end of file
+    return query.update({"owner_id": new_owner_id}, synchronize_session=False)
@@ -0,0 +1,210 @@
+"""
+POST リクエストの Idempotency-Key ヘッダに対応する ASGI ミドルウェア。
+
+同じキーで再送されたリクエストには、書き込み処理を再実行せずに保存済みのレスポンスを返す。
+同じキーのリクエストが同時に届いた場合、後続のリクエストは先行リクエストの完了を待つ。
+この待ち合わせはプロセス内でのみ行う。
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from sqlalchemy.orm import sessionmaker
+
+from . import models
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    expires_at: float
+
+
+class MemoryIdempotencyStore:
+    """
+    プロセス内のメモリに保存するストア。max_entries を超えた場合は古いものから削除する。
+    """
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        with self.lock:
+            stored = self.entries.get(key)
+            if stored is None:
+                return None
+            if stored.expires_at <= time.time():
+                del self.entries[key]
+                return None
+            return stored
+
+    def set(self, key: str, fingerprint: str, status_code: int, headers, body: bytes):
+        with self.lock:
+            self.entries[key] = StoredResponse(fingerprint, status_code, headers, body, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SQLiteIdempotencyStore:
+    """
+    idempotency_keys テーブルに保存するストア。プロセスの再起動後も保存済みのレスポンスを返せる。
+    期限切れのレコードは保存時に削除する。
+    """
+
+    def __init__(self, session_factory: sessionmaker, ttl: float = 86400):
+        self.session_factory = session_factory
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        db = self.session_factory()
+        try:
+            record = db.get(models.IdempotencyRecord, key)
+            if record is None or record.expires_at <= time.time():
+                return None
+            headers = [tuple(header) for header in json.loads(record.headers)]
+            return StoredResponse(record.fingerprint, record.status_code, headers, record.body, record.expires_at)
+        finally:
+            db.close()
+
+    def set(self, key: str, fingerprint: str, status_code: int, headers, body: bytes):
+        db = self.session_factory()
+        try:
+            now = time.time()
+            db.query(models.IdempotencyRecord).filter(models.IdempotencyRecord.expires_at <= now).delete()
+            db.merge(models.IdempotencyRecord(
+                key=key,
+                fingerprint=fingerprint,
+                status_code=status_code,
+                headers=json.dumps(headers),
+                body=body,
+                expires_at=now + self.ttl,
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+
+class IdempotencyMiddleware:
+    """
+    Idempotency-Key ヘッダ付きの POST リクエストのレスポンスを store に保存し、再送時に返す。
+    キーはパスと X-API-TOKEN ごとに区別する。5xx のレスポンスは保存しない。
+    """
+
+    def __init__(self, app, store):
+        self.app = app
+        self.store = store
+        self.in_flight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            response = JSONResponse(
+                status_code=400,
+                content={"detail": f"Idempotency-Keyは1文字以上{MAX_KEY_LENGTH}文字以下で指定してください。"},
+            )
+            await response(scope, receive, send)
+            return
+
+        key = hashlib.sha256(
+            "\n".join([scope["path"], headers.get("x-api-token", ""), idempotency_key]).encode()
+        ).hexdigest()
+
+        body_parts = []
+        while True:
+            message = await receive()
+            body_parts.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(body_parts)
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        # 同じキーのリクエストが処理中なら、その完了を待つ。
+        # 処理中の確認と登録の間に await を挟まないことで、2つのリクエストが同時に処理を始めないようにする
+        while True:
+            event = self.in_flight.get(key)
+            if event is None:
+                break
+            await event.wait()
+
+        event = asyncio.Event()
+        self.in_flight[key] = event
+        try:
+            # 処理中の登録後に保存済みのレスポンスを確認する (先行リクエストの完了後に届いた再送の場合)
+            stored = await run_in_threadpool(self.store.get, key)
+            if stored is not None:
+                await self.replay(stored, fingerprint, scope, receive, send)
+                return
+            await self.process(key, fingerprint, body, scope, receive, send)
+        finally:
+            del self.in_flight[key]
+            event.set()
+
+    async def replay(self, stored: StoredResponse, fingerprint: str, scope, receive, send):
+        if stored.fingerprint != fingerprint:
+            response = JSONResponse(
+                status_code=422,
+                content={"detail": "同じIdempotency-Keyで異なる内容のリクエストが送信されています。"},
+            )
+            await response(scope, receive, send)
+            return
+
+        raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers]
+        raw_headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": stored.status_code, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": stored.body})
+
+    async def process(self, key: str, fingerprint: str, body: bytes, scope, receive, send):
+        body_consumed = False
+        start_message = None
+        response_parts = []
+
+        async def replay_receive():
+            nonlocal body_consumed
+            if not body_consumed:
+                body_consumed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body":
+                response_parts.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, replay_receive, send_wrapper)
+
+        if start_message is not None and start_message["status"] < 500:
+            stored_headers = [
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in start_message.get("headers", [])
+            ]
+            await run_in_threadpool(
+                self.store.set, key, fingerprint, start_message["status"], stored_headers, b"".join(response_parts)
+            )
@@ -0,0 +1,189 @@
+"""
+プロセス内で動くバックグラウンドジョブの実行処理。
+
+ジョブの状態は jobs テーブルに保存するため、処理の途中でプロセスが再起動しても
+起動時に resume_jobs を呼ぶことで未完了のジョブを続きから再開できる。
+複数のプロセスで起動した場合も、ジョブは jobs テーブル上で担当を取得したプロセスだけが実行する。
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from logging import getLogger
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from . import crud, models
+
+logger = getLogger(__name__)
+
+# 1回のトランザクションで移行する Item の件数
+REASSIGN_CHUNK_SIZE = 1000
+# チャンク間で待つ秒数。SQLite の書き込みロックを他のリクエストに譲るために入れる
+REASSIGN_CHUNK_PAUSE = 0.01
+# OperationalError ("database is locked" など) のときにチャンクを再実行する回数と、初回の待ち秒数 (再実行ごとに倍にする)
+REASSIGN_MAX_RETRIES = 5
+REASSIGN_RETRY_DELAY = 0.1
+# 担当のワーカーがこの秒数だけ進捗を記録していない running のジョブは、停止したものとみなして他のワーカーが引き継ぐ
+JOB_CLAIM_TIMEOUT = 60
+
+_PROCESS_NONCE = uuid.uuid4().hex[:8]
+
+
+class JobClaimLost(Exception):
+    """ジョブの担当が他のワーカーに移ったため、処理を中止する。"""
+
+
+def worker_id() -> str:
+    """このプロセスを表す ID。fork した子プロセスでも異なる値になるよう pid を含める。"""
+    return f"{socket.gethostname()}:{os.getpid()}:{_PROCESS_NONCE}"
+
+
+def retry_on_operational_error(db, func):
+    """
+    func を実行する。OperationalError の場合はロールバックし、待ち時間を倍にしながら再実行する。
+    REASSIGN_MAX_RETRIES 回再実行しても失敗した場合は例外をそのまま送出する。
+    """
+    delay = REASSIGN_RETRY_DELAY
+    for retry in range(REASSIGN_MAX_RETRIES + 1):
+        try:
+            return func()
+        except OperationalError:
+            db.rollback()
+            if retry == REASSIGN_MAX_RETRIES:
+                raise
+            logger.warning("DB の操作に失敗したため、%s 秒後に再実行します。", delay, exc_info=True)
+            time.sleep(delay)
+            delay *= 2
+
+
+def reassign_next_chunk(db, job) -> bool:
+    """
+    1チャンク分の Item を移行し、進捗と合わせてコミットして、移行が完了したかを返す。
+    移行先のユーザが無効化されている場合は、移行先を選び直してジョブに保存する。
+    """
+    new_owner_id = job.new_owner_id
+    if new_owner_id is not None and not crud.is_active_user(db, new_owner_id):
+        new_owner = crud.get_reassign_target(db, job.user_id)
+        new_owner_id = new_owner.id if new_owner else None
+
+    count = crud.reassign_items_chunk(
+        db,
+        user_id=job.user_id,
+        new_owner_id=new_owner_id,
+        chunk_size=REASSIGN_CHUNK_SIZE,
+    )
+    # 移行先がチェック後に無効化されて移行できなかった場合は、次のチャンクで移行先を選び直す
+    finished = count < REASSIGN_CHUNK_SIZE and (
+        new_owner_id is None or crud.is_active_user(db, new_owner_id)
+    )
+    # 件数は SQL 上で加算し、担当が他のワーカーに移っていればこのチャンクの移行ごと取り消す
+    if not crud.update_claimed_job(
+        db, job.id, worker_id(), time.time(), processed=count, new_owner_id=new_owner_id
+    ):
+        db.rollback()
+        raise JobClaimLost(job.id)
+    db.commit()
+    return finished
+
+
+def run_reassign_items(db, job):
+    """
+    無効化したユーザの Item をチャンクごとに移行する。
+    チャンクごとにコミットし、書き込みロックを長時間保持しないようにする。
+    移行済みの Item は owner_id が変わっているため、途中から再実行しても同じ結果になる。
+    """
+    while not retry_on_operational_error(db, lambda: reassign_next_chunk(db, job)):
+        time.sleep(REASSIGN_CHUNK_PAUSE)
+
+
+JOB_HANDLERS = {
+    "reassign_items": run_reassign_items,
+}
+
+
+def finish_job(db, job_id: int, **values):
+    """担当しているジョブの状態を更新してコミットする。"""
+    def update():
+        if not crud.update_claimed_job(db, job_id, worker_id(), time.time(), **values):
+            logger.warning("ジョブ %s の担当が他のワーカーに移ったため、状態を更新しません。", job_id)
+        db.commit()
+
+    retry_on_operational_error(db, update)
+
+
+def run_job(session_factory: sessionmaker, job_id: int) -> bool:
+    """
+    ジョブを1件実行する。完了済みのジョブは何もしない。
+    再実行しても OperationalError が続く場合は、pending に戻して次回の起動時に再開する。
+    他のワーカーが実行中のため担当を取得できなかった場合のみ False を返す。
+    """
+    db = session_factory()
+    try:
+        job = crud.get_job(db, job_id=job_id)
+        if job is None or job.status not in ("pending", "running"):
+            return True
+
+        def claim():
+            now = time.time()
+            claimed = crud.claim_job(db, job_id, worker_id(), now, stale_before=now - JOB_CLAIM_TIMEOUT)
+            db.commit()
+            return claimed
+
+        if not retry_on_operational_error(db, claim):
+            return False
+
+        try:
+            JOB_HANDLERS[job.kind](db, job)
+        except JobClaimLost:
+            logger.warning("ジョブ %s の担当が他のワーカーに移ったため、処理を中止します。", job_id)
+        except OperationalError as e:
+            logger.exception("ジョブ %s を中断しました。次回の起動時に再開します。", job_id)
+            db.rollback()
+            finish_job(
+                db, job_id, status="pending", attempts=models.Job.attempts + 1, error=str(e),
+                claimed_by=None, claimed_at=None,
+            )
+        except Exception as e:
+            logger.exception("ジョブ %s の実行に失敗しました。", job_id)
+            db.rollback()
+            finish_job(db, job_id, status="failed", error=str(e))
+        else:
+            finish_job(db, job_id, status="done")
+        return True
+    finally:
+        db.close()
+
+
+def run_jobs(session_factory: sessionmaker, job_ids):
+    """
+    ジョブを順に実行する。他のワーカーが実行中のジョブは JOB_CLAIM_TIMEOUT 秒ごとに担当の取得を再試行し、
+    そのワーカーが停止していれば引き継ぐ (完了すれば何もせずに終わる)。
+    """
+    while job_ids:
+        busy = []
+        for job_id in job_ids:
+            logger.info("未完了のジョブ %s を再開します。", job_id)
+            if not run_job(session_factory, job_id):
+                busy.append(job_id)
+        job_ids = busy
+        if job_ids:
+            time.sleep(JOB_CLAIM_TIMEOUT)
+
+
+def resume_jobs(session_factory: sessionmaker):
+    """
+    未完了 (pending/running) のジョブを別スレッドで順に再開する。アプリの起動時に呼び出す。
+    他のプロセスが実行中のジョブは、そのプロセスが停止するまで実行しない。
+    """
+    db = session_factory()
+    try:
+        job_ids = [job.id for job in crud.get_unfinished_jobs(db)]
+    finally:
+        db.close()
+
+    if job_ids:
+        threading.Thread(target=run_jobs, args=(session_factory, job_ids), daemon=True).start()
+    return job_ids
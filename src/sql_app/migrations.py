@@ -0,0 +1,158 @@
+"""
+バージョン管理されたスキーママイグレーション。
+
+適用済みのバージョンを schema_version テーブルに保存し、起動時に upgrade を1回呼ぶ。
+バージョンが最新であれば SELECT を1回実行するだけで、テーブル定義の確認 (DDL の inspect) は行わない。
+
+単体でも実行できる (リポジトリのルートで):
+    python -m src.sql_app.migrations
+"""
+from logging import getLogger
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, MetaData, String, Table,
+    delete, func, insert, inspect, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+from . import models
+
+logger = getLogger(__name__)
+
+
+# バージョン 1 時点のスキーマ。models.py を変更してもここは変更せず、差分は新しいマイグレーションとして追加する
+baseline_metadata = MetaData()
+
+Table(
+    "users", baseline_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("email", String),
+    Column("hashed_password", String),
+    Column("token", String, nullable=False),
+    Column("is_active", Boolean),
+    Index("ix_users_id", "id"),
+    Index("ix_users_email", "email", unique=True),
+)
+
+Table(
+    "items", baseline_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("title", String),
+    Column("description", String),
+    Column("owner_id", Integer, ForeignKey("users.id")),
+    Index("ix_items_id", "id"),
+    Index("ix_items_title", "title"),
+    Index("ix_items_description", "description"),
+)
+
+Table(
+    "jobs", baseline_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("kind", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("new_owner_id", Integer, nullable=True),
+    Column("processed", Integer, nullable=False),
+    Column("error", String, nullable=True),
+    Column("created_at", DateTime, server_default=func.now()),
+    Column("updated_at", DateTime, server_default=func.now()),
+    Index("ix_jobs_id", "id"),
+    Index("ix_jobs_status", "status"),
+)
+
+Table(
+    "idempotency_keys", baseline_metadata,
+    Column("key", String, primary_key=True),
+    Column("fingerprint", String, nullable=False),
+    Column("status_code", Integer, nullable=False),
+    Column("headers", String, nullable=False),
+    Column("body", LargeBinary, nullable=False),
+    Column("expires_at", Float, nullable=False),
+    Index("ix_idempotency_keys_expires_at", "expires_at"),
+)
+
+Table(
+    "schema_version", baseline_metadata,
+    Column("version", Integer, primary_key=True),
+)
+
+
+def create_baseline(conn: Connection):
+    """バージョン 1 時点のテーブルを作成する。作成済みのテーブルはそのまま残す。"""
+    baseline_metadata.create_all(bind=conn)
+
+
+def add_lookup_indexes(conn: Connection):
+    """
+    トークン認証と、ユーザごとの Item 一覧に使うインデックスを追加する。
+    create_all は既存のテーブルにインデックスを追加しないため、既存の DB にはここで作成する。
+    """
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_token ON users (token)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_items_owner_id_id ON items (owner_id, id)"))
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    """テーブルに列がなければ追加する。"""
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def add_job_attempts(conn: Connection):
+    """ジョブを再実行待ちに戻した回数を保存する列を追加する。"""
+    add_column(conn, "jobs", "attempts", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_job_claims(conn: Connection):
+    """ジョブを実行中のワーカーと、その最終更新時刻を保存する列を追加する。"""
+    add_column(conn, "jobs", "claimed_by", "VARCHAR")
+    add_column(conn, "jobs", "claimed_at", "FLOAT")
+
+
+# (バージョン, マイグレーション関数)。各マイグレーションは何度実行しても同じ結果になるように書く
+MIGRATIONS = [
+    (1, create_baseline),
+    (2, add_lookup_indexes),
+    (3, add_job_attempts),
+    (4, add_job_claims),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn: Connection) -> int:
+    """
+    適用済みのバージョンを返す。schema_version テーブルがない場合は 0 を返す。
+    DB に接続できない場合などそれ以外のエラーはそのまま送出する。
+    """
+    try:
+        version = conn.execute(select(models.SchemaVersion.version)).scalar()
+    except DBAPIError:
+        # テーブルの有無は SELECT に失敗したときだけ確認する (別の接続で確認する)
+        if inspect(conn.engine).has_table(models.SchemaVersion.__tablename__):
+            raise
+        return 0
+    return version or 0
+
+
+def upgrade(engine: Engine) -> int:
+    """未適用のマイグレーションを順に適用し、適用後のバージョンを返す。"""
+    with engine.connect() as conn:
+        version = get_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    with engine.begin() as conn:
+        for migration_version, migrate in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            logger.info("マイグレーション %s (%s) を適用します。", migration_version, migrate.__name__)
+            migrate(conn)
+        conn.execute(delete(models.SchemaVersion))
+        conn.execute(insert(models.SchemaVersion).values(version=LATEST_VERSION))
+    return LATEST_VERSION
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    print(f"schema version: {upgrade(engine)}")
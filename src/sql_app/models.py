@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, String, func
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -10,7 +10,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
-    token = Column(String, nullable=False)
+    token = Column(String, nullable=False, index=True)
     is_active = Column(Boolean, default=True)
 
     items = relationship("Item", back_populates="owner") # 双方向リレーションを自分で定義する
@@ -25,3 +25,41 @@ class Item(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="items") # 双方向リレーションを自分で定義する
+
+    __table_args__ = (
+        Index("ix_items_owner_id_id", "owner_id", "id"), # ユーザごとの Item 一覧を id 順に取得するため
+    )
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending", index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    new_owner_id = Column(Integer, nullable=True) # 移行先のユーザ。有効なユーザがいないときは NULL
+    processed = Column(Integer, nullable=False, default=0) # 処理済みの件数
+    attempts = Column(Integer, nullable=False, default=0, server_default="0") # DB のロックなどで中断し、再実行待ちに戻した回数
+    error = Column(String, nullable=True)
+    claimed_by = Column(String, nullable=True) # 実行中のワーカー (jobs.worker_id)
+    claimed_at = Column(Float, nullable=True) # 実行中のワーカーが最後に進捗を記録した時刻 (UNIX 時間)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True) # パス・X-API-TOKEN・Idempotency-Key から作ったハッシュ (POST のみ対象)
+    fingerprint = Column(String, nullable=False) # リクエスト本文のハッシュ
+    status_code = Column(Integer, nullable=False)
+    headers = Column(String, nullable=False) # JSON 文字列
+    body = Column(LargeBinary, nullable=False)
+    expires_at = Column(Float, nullable=False, index=True) # UNIX 時間
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True) # 適用済みのマイグレーションのバージョン
@@ -0,0 +1,69 @@
+"""
+一覧取得用の読み取り専用のデータアクセス層。
+
+ORM のインスタンスを作らず、SQLAlchemy Core の select() で必要な列だけを取得して
+NamedTuple に詰める。セッションのアイデンティティマップにも載らないため、
+大きなページを返すときのメモリ確保と GC の負担が小さい。
+書き込みや、取得後にオブジェクトを更新する処理には crud.py を使う。
+"""
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+class ItemRow(NamedTuple):
+    id: int
+    title: str
+    description: Optional[str]
+    owner_id: Optional[int]
+
+
+class UserRow(NamedTuple):
+    id: int
+    email: str
+    is_active: bool
+    items: List[ItemRow]
+
+
+ITEM_COLUMNS = (models.Item.id, models.Item.title, models.Item.description, models.Item.owner_id)
+USER_COLUMNS = (models.User.id, models.User.email, models.User.is_active)
+
+
+def get_items(db: Session, skip: int = 0, limit: int = 100):
+    stmt = select(*ITEM_COLUMNS).order_by(models.Item.id).offset(skip).limit(limit)
+    return [ItemRow._make(row) for row in db.execute(stmt)]
+
+
+def get_items_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+    stmt = (
+        select(*ITEM_COLUMNS)
+        .where(models.Item.owner_id == user_id)
+        .order_by(models.Item.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return [ItemRow._make(row) for row in db.execute(stmt)]
+
+
+def get_users(db: Session, skip: int = 0, limit: int = 100):
+    """
+    ユーザの一覧を、各ユーザが所有する Item と合わせて取得する。
+    Item はユーザごとではなく、ページ内のユーザ分を1回の IN クエリでまとめて取得する。
+    """
+    stmt = select(*USER_COLUMNS).order_by(models.User.id).offset(skip).limit(limit)
+    users = [UserRow(id, email, is_active, []) for id, email, is_active in db.execute(stmt)]
+    if not users:
+        return users
+
+    items_by_owner = {user.id: user.items for user in users}
+    items_stmt = (
+        select(*ITEM_COLUMNS)
+        .where(models.Item.owner_id.in_(list(items_by_owner)))
+        .order_by(models.Item.id)
+    )
+    for row in db.execute(items_stmt):
+        items_by_owner[row[3]].append(ItemRow._make(row))
+    return users
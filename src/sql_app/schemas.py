@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 import re
 from logging import getLogger
@@ -30,6 +31,11 @@ class ItemList(BaseModel):
     message: Optional[str] = None
 
 
+class ItemBatch(BaseModel):
+    items: List[Item]
+    missing_ids: List[int] = []
+
+
 class UserBase(BaseModel):
     email: str
 
@@ -74,3 +80,29 @@ class User(UserBase):
 
 class UserCreateResponse(User):
     token: str
+
+
+class UserBatch(BaseModel):
+    users: List[User]
+    missing_ids: List[int] = []
+
+
+class UserDeleteResponse(User):
+    job_id: Optional[int] = None # Item の移行を行うジョブ。/jobs/{job_id} で進捗を確認できる
+
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    user_id: Optional[int] = None
+    new_owner_id: Optional[int] = None
+    processed: int
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    model_config = ConfigDict(
+        from_attributes=True
+    )
@@ -0,0 +1,225 @@
+"""
+大量の疑似データを DB に投入する CLI と、データ量ごとの主要クエリの所要時間を測るスケールテスト。
+
+Item の所有者は Zipf 分布に従って割り当てる。ID の小さいユーザほど多くの Item を持つため、
+少数のヘビーユーザと多数のライトユーザがいる状態になる (--skew を大きくするほど偏る)。
+投入中は一意制約と認証に使うもの以外のセカンダリインデックスを削除し、投入後にまとめて作成し直す。
+
+実行方法 (リポジトリのルートで):
+    # 投入先の DB は --database-url で必ず明示する
+    python -m src.sql_app.seed seed --database-url sqlite:///./data/seed.db --users 1000 --items 50000
+    # ユーザ数を 1,000 → 10,000 → 100,000 と増やしながら主要クエリを計測する
+    python -m src.sql_app.seed scale-test --steps 1000,10000,100000 --output scale_test.csv
+"""
+import argparse
+import csv
+import itertools
+import random
+import secrets
+import statistics
+import time
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from . import crud, jobs, migrations, models, queries
+
+BATCH_SIZE = 10000
+SEEDED_TABLES = (models.User.__table__, models.Item.__table__)
+# 投入中も残すインデックス (一意制約のインデックスはこれに加えて常に残す)
+KEPT_INDEXES = {"ix_users_token"}  # トークン認証で使う
+
+
+def owner_cum_weights(n_users: int, skew: float):
+    """ID の順位 k のユーザが 1 / k^skew に比例して Item を持つ累積重みを返す。"""
+    return list(itertools.accumulate(1 / rank ** skew for rank in range(1, n_users + 1)))
+
+
+def drop_deferred_indexes(conn):
+    """投入後に作り直すインデックスを削除し、削除したインデックスのリストを返す。"""
+    dropped = []
+    for table in SEEDED_TABLES:
+        for index in table.indexes:
+            if index.unique or index.name in KEPT_INDEXES:
+                continue
+            index.drop(conn, checkfirst=True)
+            dropped.append(index)
+    return dropped
+
+
+def create_indexes(conn, indexes):
+    for index in indexes:
+        index.create(conn, checkfirst=True)
+
+
+def seed(engine: Engine, n_users: int, n_items: int, skew: float = 1.1, batch_size: int = BATCH_SIZE, rng=None):
+    """
+    ユーザ n_users 人と Item n_items 件を追加する。Item の所有者は既存のユーザを含む全ユーザから選ぶ。
+    """
+    rng = rng or random.Random()
+    migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            # 投入中は fsync を省略する (この接続のみ)
+            conn.execute(text("PRAGMA synchronous = OFF"))
+
+        user_start = (conn.execute(select(func.max(models.User.id))).scalar() or 0) + 1
+        item_start = (conn.execute(select(func.max(models.Item.id))).scalar() or 0) + 1
+        total_users = user_start - 1 + n_users
+        if n_items and total_users == 0:
+            raise ValueError("Item の所有者となるユーザがいません。")
+
+        dropped = drop_deferred_indexes(conn)
+        conn.commit()
+
+        try:
+            for start in range(user_start, user_start + n_users, batch_size):
+                stop = min(start + batch_size, user_start + n_users)
+                conn.execute(insert(models.User), [
+                    {
+                        "id": user_id,
+                        "email": f"seed{user_id}@example.com",
+                        "hashed_password": "notreallyhashed",
+                        "token": secrets.token_hex(16),
+                        "is_active": True,
+                    }
+                    for user_id in range(start, stop)
+                ])
+                conn.commit()
+
+            cum_weights = owner_cum_weights(total_users, skew)
+            owner_ids = range(1, total_users + 1)
+            for start in range(item_start, item_start + n_items, batch_size):
+                stop = min(start + batch_size, item_start + n_items)
+                owners = rng.choices(owner_ids, cum_weights=cum_weights, k=stop - start)
+                conn.execute(insert(models.Item), [
+                    {"id": item_id, "title": f"Task {item_id}", "description": f"seeded task {item_id}", "owner_id": owner_id}
+                    for item_id, owner_id in zip(range(start, stop), owners)
+                ])
+                conn.commit()
+        finally:
+            # 投入に失敗・中断した場合も、削除したインデックスを必ず作り直す
+            conn.rollback()
+            create_indexes(conn, dropped)
+            conn.commit()
+
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("ANALYZE"))
+        conn.commit()
+
+
+def measure(func, repeat: int) -> float:
+    """func を repeat 回実行し、所要時間の中央値 (ミリ秒) を返す。"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure_queries(session_factory: sessionmaker, repeat: int):
+    """主要なクエリの所要時間の中央値 (ミリ秒) を {クエリ名: 時間} で返す。"""
+    db = session_factory()
+    try:
+        n_items = db.execute(select(func.count(models.Item.id))).scalar()
+        n_users = db.execute(select(func.max(models.User.id))).scalar()
+        token = db.execute(select(models.User.token).where(models.User.id == n_users)).scalar()
+
+        def reassign_chunk():
+            # 1チャンク分の移行 (書き込みロックを保持する時間) を計測し、変更は戻す
+            crud.reassign_items_chunk(db, user_id=1, new_owner_id=2, chunk_size=jobs.REASSIGN_CHUNK_SIZE)
+            db.rollback()
+
+        cases = {
+            "get_items (first page)": lambda: queries.get_items(db, skip=0, limit=100),
+            "get_items (middle page)": lambda: queries.get_items(db, skip=n_items // 2, limit=100),
+            "get_items_for_user (power user)": lambda: queries.get_items_for_user(db, user_id=1, limit=100),
+            "get_items_for_user (tail user)": lambda: queries.get_items_for_user(db, user_id=n_users, limit=100),
+            "get_users (first page)": lambda: queries.get_users(db, skip=0, limit=100),
+            "get_user_by_token": lambda: crud.get_user_by_token(db, token=token),
+            "reassign_items_chunk (power user)": reassign_chunk,
+        }
+        results = {}
+        for name, case in cases.items():
+            results[name] = measure(case, repeat)
+            db.expunge_all()
+        return results
+    finally:
+        db.close()
+
+
+def scale_test(engine: Engine, steps, items_per_user: int, skew: float, repeat: int, rng=None):
+    """
+    ユーザ数が steps の各値になるまでデータを追加しながら主要クエリを計測し、
+    (ユーザ数, Item 数, クエリ名, 中央値 [ms]) の行を返す。
+    """
+    rng = rng or random.Random()
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    rows = []
+    with engine.connect() as conn:
+        n_users = conn.execute(select(func.count(models.User.id))).scalar() if migrations.get_version(conn) else 0
+    for step in steps:
+        if step <= n_users:
+            continue
+        seed(engine, step - n_users, (step - n_users) * items_per_user, skew=skew, rng=rng)
+        n_users = step
+        for name, elapsed in measure_queries(session_factory, repeat).items():
+            rows.append((n_users, n_users * items_per_user, name, elapsed))
+    return rows
+
+
+def print_scale_report(rows):
+    """各クエリの所要時間と、1つ前のステップからの増加率を表示する。"""
+    previous = {}
+    print(f"{'users':>10} {'items':>12}  {'query':<36} {'median ms':>10} {'growth':>8}")
+    for n_users, n_items, name, elapsed in rows:
+        growth = f"x{elapsed / previous[name]:.2f}" if previous.get(name) else ""
+        previous[name] = elapsed
+        print(f"{n_users:>10} {n_items:>12}  {name:<36} {elapsed:>10.3f} {growth:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--random-seed", type=int, default=None, help="乱数のシード (再現性が必要な場合)")
+    parser.add_argument("--skew", type=float, default=1.1, help="Item の所有者の偏り (Zipf 分布の指数)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="ユーザと Item を追加する")
+    seed_parser.add_argument("--database-url", required=True, help="投入先の DB (アプリの DB を誤って指定しないよう必須)")
+    seed_parser.add_argument("--users", type=int, required=True)
+    seed_parser.add_argument("--items", type=int, required=True)
+    seed_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    scale_parser = subparsers.add_parser("scale-test", help="データ量を増やしながら主要クエリを計測する")
+    scale_parser.add_argument("--database-url", default="sqlite:///./data/scale_test.db")
+    scale_parser.add_argument("--steps", default="1000,10000,100000", help="ユーザ数の段階 (カンマ区切り)")
+    scale_parser.add_argument("--items-per-user", type=int, default=50)
+    scale_parser.add_argument("--repeat", type=int, default=20)
+    scale_parser.add_argument("--output", default=None, help="結果を書き出す CSV ファイル")
+
+    args = parser.parse_args()
+    rng = random.Random(args.random_seed)
+    engine = create_engine(args.database_url)
+    try:
+        if args.command == "seed":
+            start = time.perf_counter()
+            seed(engine, args.users, args.items, skew=args.skew, batch_size=args.batch_size, rng=rng)
+            print(f"{args.users} users / {args.items} items seeded in {time.perf_counter() - start:.1f} s")
+        else:
+            steps = sorted(int(step) for step in args.steps.split(","))
+            rows = scale_test(engine, steps, args.items_per_user, args.skew, args.repeat, rng=rng)
+            print_scale_report(rows)
+            if args.output:
+                with open(args.output, "w", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["users", "items", "query", "median_ms"])
+                    writer.writerows(rows)
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
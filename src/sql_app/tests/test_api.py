@@ -1,7 +1,18 @@
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+from fastapi import FastAPI, Response
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import DBAPIError, OperationalError
 from sqlalchemy.orm import Session
 from ..main import app
 from ..database import SessionLocal, engine
+from .. import compression, crud, idempotency, jobs, migrations, models, seed
+from .conftest import TestingSessionLocal, engine as test_engine
 import pytest
 
 @pytest.fixture
@@ -303,3 +314,702 @@ def test_read_users_unauthorized(test_db, client):
     response = client.get("/users/", headers={"X-API-TOKEN": user['token']})
     assert response.status_code == 403
     assert response.json()["detail"] == "ユーザーの情報は削除されています。"
+
+
+def test_read_users_with_items(test_db, client):
+    """GET /users/, GET /me/items のエンドポイントに対する正常系テスト。
+    - 各ユーザーの items に、そのユーザーが所有する Item だけが id 順に含まれること
+    - skip/limit で指定したページのユーザーの Item だけが含まれること
+    - GET /me/items の Item が id 順に返却されること
+    """
+    user_a = client.post("/users/", json={"email": "a@example.com", "password": "abCD1234"}).json()
+    user_b = client.post("/users/", json={"email": "b@example.com", "password": "abCD1234"}).json()
+    user_c = client.post("/users/", json={"email": "c@example.com", "password": "abCD1234"}).json()
+
+    # 所有者が交互になるように作成する (id: A=1,3,5 / B=2,4)
+    for i, user in enumerate([user_a, user_b, user_a, user_b, user_a]):
+        response = client.post(
+            "/me/items/",
+            json={"title": f"Task {i + 1}", "description": f"Item {i + 1}"},
+            headers={"X-API-TOKEN": user["token"]},
+        )
+        assert response.status_code == 200
+        assert response.json()["id"] == i + 1
+
+    def item(item_id, owner):
+        return {"id": item_id, "title": f"Task {item_id}", "description": f"Item {item_id}", "owner_id": owner["id"]}
+
+    response = client.get("/users/", headers={"X-API-TOKEN": user_c["token"]})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": user_a["id"], "email": "a@example.com", "is_active": True, "items": [item(1, user_a), item(3, user_a), item(5, user_a)]},
+        {"id": user_b["id"], "email": "b@example.com", "is_active": True, "items": [item(2, user_b), item(4, user_b)]},
+        {"id": user_c["id"], "email": "c@example.com", "is_active": True, "items": []},
+    ]
+
+    response = client.get("/users/", params={"skip": 1, "limit": 1}, headers={"X-API-TOKEN": user_c["token"]})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": user_b["id"], "email": "b@example.com", "is_active": True, "items": [item(2, user_b), item(4, user_b)]},
+    ]
+
+    response = client.get("/me/items", headers={"X-API-TOKEN": user_a["token"]})
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["items"]] == [1, 3, 5]
+
+
+# バッチ取得のテスト
+def test_read_users_and_items_batch(test_db, client):
+    """GET /users/batch, GET /items/batch のエンドポイントに対するテスト。
+    - 指定したIDの順序でユーザー・アイテムが返却されること
+    - 存在しないIDが missing_ids として返却されること
+    - 上限件数を超えるIDを指定した場合に異常系（status=400）のレスポンスが返却されること
+    """
+    users = []
+    for i in range(3):
+        response = client.post(
+            "/users/",
+            json={"email": f"batch{i}@example.com", "password": "abCD1234"},
+        )
+        assert response.status_code == 200
+        users.append(response.json())
+    token = users[0]["token"]
+
+    for user in users:
+        client.post(
+            "/me/items/",
+            json={"title": f"Task {user['id']}"},
+            headers={"X-API-TOKEN": user["token"]},
+        )
+
+    response = client.get(
+        "/users/batch",
+        params={"ids": [users[2]["id"], 999, users[0]["id"], users[2]["id"]]},
+        headers={"X-API-TOKEN": token},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [user["id"] for user in data["users"]] == [users[2]["id"], users[0]["id"]]
+    assert data["users"][0]["items"][0]["owner_id"] == users[2]["id"]
+    assert data["missing_ids"] == [999]
+
+    response = client.get(
+        "/items/batch",
+        params={"ids": [3, 1, 42]},
+        headers={"X-API-TOKEN": token},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["id"] for item in data["items"]] == [3, 1]
+    assert data["missing_ids"] == [42]
+
+    response = client.get(
+        "/items/batch",
+        params={"ids": list(range(1, 102))},
+        headers={"X-API-TOKEN": token},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "一度に指定できるIDは100件までです。"
+
+
+# ユーザー削除時の Item 移行ジョブのテスト
+def test_delete_user_reassign_job(test_db, client, monkeypatch):
+    """DELETE /users/{user_id}, GET /jobs/{job_id} のエンドポイントに対するテスト。
+    - Item の移行がチャンクに分けて行われ、ジョブが完了状態になること
+    - 存在しないジョブを指定した場合に異常系（status=404）のレスポンスが返却されること
+    """
+    monkeypatch.setattr(jobs, "REASSIGN_CHUNK_SIZE", 2)
+    monkeypatch.setattr(jobs, "REASSIGN_CHUNK_PAUSE", 0)
+
+    user_a = client.post("/users/", json={"email": "a@example.com", "password": "abCD1234"}).json()
+    user_b = client.post("/users/", json={"email": "b@example.com", "password": "abCD1234"}).json()
+    for i in range(5):
+        client.post("/me/items/", json={"title": f"Task B{i}"}, headers={"X-API-TOKEN": user_b["token"]})
+
+    response = client.delete(f"/users/{user_b['id']}", headers={"X-API-TOKEN": user_a["token"]})
+    assert response.status_code == 200
+    deleted_b = response.json()
+    job_id = deleted_b["job_id"]
+    assert job_id is not None
+    # 移行対象の Item はレスポンスに含めない
+    assert deleted_b == {
+        "id": user_b["id"],
+        "email": user_b["email"],
+        "is_active": False,
+        "items": [],
+        "job_id": job_id,
+    }
+
+    response = client.get(f"/jobs/{job_id}", headers={"X-API-TOKEN": user_a["token"]})
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "done"
+    assert job["processed"] == 5
+    assert job["user_id"] == user_b["id"]
+    assert job["new_owner_id"] == user_a["id"]
+
+    items_a = client.get("/me/items", headers={"X-API-TOKEN": user_a["token"]}).json()["items"]
+    assert len(items_a) == 5
+
+    # すでに無効化済みのユーザーを再度削除してもジョブは作成されない
+    response = client.delete(f"/users/{user_b['id']}", headers={"X-API-TOKEN": user_a["token"]})
+    assert response.status_code == 200
+    assert response.json()["job_id"] is None
+
+    response = client.get("/jobs/999", headers={"X-API-TOKEN": user_a["token"]})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "ジョブが見つかりません。"
+
+
+def test_delete_users_in_a_row_reassigns_to_active_user(test_db, client):
+    """移行先のユーザーがジョブの実行前に削除された場合のテスト。
+    - 削除済みのユーザーに Item が残らず、有効なユーザーに移行されること
+    - ジョブの移行先が選び直されて保存されること
+    """
+    users = [
+        client.post("/users/", json={"email": f"row{i}@example.com", "password": "abCD1234"}).json()
+        for i in range(3)
+    ]
+    user_a, user_b, user_c = users
+    for user in (user_a, user_b):
+        for i in range(3):
+            client.post("/me/items/", json={"title": f"Task {user['id']}-{i}"}, headers={"X-API-TOKEN": user["token"]})
+
+    # B の削除ジョブ (移行先は A) を作成し、実行前に A を削除する
+    db = TestingSessionLocal()
+    try:
+        _, job_b = crud.deactivate_user_and_create_reassign_job(db, user_b["id"])
+        assert job_b.new_owner_id == user_a["id"]
+        job_b_id = job_b.id
+    finally:
+        db.close()
+
+    response = client.delete(f"/users/{user_a['id']}", headers={"X-API-TOKEN": user_c["token"]})
+    assert response.status_code == 200
+
+    jobs.run_job(TestingSessionLocal, job_b_id)
+
+    job = client.get(f"/jobs/{job_b_id}", headers={"X-API-TOKEN": user_c["token"]}).json()
+    assert job["status"] == "done"
+    assert job["new_owner_id"] == user_c["id"]
+    items = client.get("/items/", headers={"X-API-TOKEN": user_c["token"]}).json()["items"]
+    assert len(items) == 6
+    assert {item["owner_id"] for item in items} == {user_c["id"]}
+
+
+def test_reassign_items_chunk_skips_inactive_owner(test_db):
+    """移行先のユーザーが無効化されている場合、Item の所有者が変更されないこと。"""
+    db = TestingSessionLocal()
+    try:
+        db.add_all([
+            models.User(id=1, email="a@example.com", hashed_password="x", token="a", is_active=False),
+            models.User(id=2, email="b@example.com", hashed_password="x", token="b", is_active=False),
+        ])
+        db.add(models.Item(title="Task", owner_id=2))
+        db.commit()
+
+        assert crud.reassign_items_chunk(db, user_id=2, new_owner_id=1, chunk_size=10) == 0
+        db.commit()
+        assert db.query(models.Item).filter(models.Item.owner_id == 2).count() == 1
+    finally:
+        db.close()
+
+
+def test_run_job_resumes_unfinished_job(test_db):
+    """プロセス再起動を想定し、途中まで処理された running 状態のジョブを再実行すると残りの Item が移行されること。"""
+    db = TestingSessionLocal()
+    try:
+        db.add_all([
+            models.User(id=1, email="a@example.com", hashed_password="x", token="a", is_active=True),
+            models.User(id=2, email="b@example.com", hashed_password="x", token="b", is_active=False),
+        ])
+        db.add_all(models.Item(title=f"Task {i}", owner_id=1 if i < 2 else 2) for i in range(5))
+        db.add(models.Job(id=1, kind="reassign_items", status="running", user_id=2, new_owner_id=1, processed=2))
+        db.commit()
+
+        jobs.run_job(TestingSessionLocal, 1)
+
+        db.expire_all()
+        job = db.get(models.Job, 1)
+        assert job.status == "done"
+        assert job.processed == 5
+        assert db.query(models.Item).filter(models.Item.owner_id == 2).count() == 0
+    finally:
+        db.close()
+
+
+def test_run_job_retries_when_database_is_locked(test_db, monkeypatch):
+    """Item の移行中に DB がロックされた場合のテスト。
+    - 一時的なロックであれば、チャンクを再実行してジョブが完了すること
+    - ロックが続く場合は failed にせず pending に戻し、再開するとジョブが完了すること
+    """
+    monkeypatch.setattr(jobs, "REASSIGN_CHUNK_SIZE", 2)
+    monkeypatch.setattr(jobs, "REASSIGN_CHUNK_PAUSE", 0)
+    monkeypatch.setattr(jobs, "REASSIGN_RETRY_DELAY", 0)
+    reassign_items_chunk = crud.reassign_items_chunk
+    failures = {"remaining": 0}
+
+    def locked_reassign_items_chunk(*args, **kwargs):
+        if failures["remaining"] > 0:
+            failures["remaining"] -= 1
+            raise OperationalError("UPDATE items ...", {}, Exception("database is locked"))
+        return reassign_items_chunk(*args, **kwargs)
+
+    monkeypatch.setattr(crud, "reassign_items_chunk", locked_reassign_items_chunk)
+
+    db = TestingSessionLocal()
+    try:
+        db.add_all([
+            models.User(id=1, email="a@example.com", hashed_password="x", token="a", is_active=True),
+            models.User(id=2, email="b@example.com", hashed_password="x", token="b", is_active=False),
+            models.User(id=3, email="c@example.com", hashed_password="x", token="c", is_active=False),
+        ])
+        db.add_all(models.Item(title=f"Task {i}", owner_id=2 if i < 5 else 3) for i in range(10))
+        db.add_all([
+            models.Job(id=1, kind="reassign_items", status="pending", user_id=2, new_owner_id=1, processed=0),
+            models.Job(id=2, kind="reassign_items", status="pending", user_id=3, new_owner_id=1, processed=0),
+        ])
+        db.commit()
+
+        failures["remaining"] = jobs.REASSIGN_MAX_RETRIES
+        jobs.run_job(TestingSessionLocal, 1)
+        db.expire_all()
+        job = db.get(models.Job, 1)
+        assert (job.status, job.processed, job.attempts) == ("done", 5, 0)
+
+        failures["remaining"] = jobs.REASSIGN_MAX_RETRIES + 1
+        jobs.run_job(TestingSessionLocal, 2)
+        db.expire_all()
+        job = db.get(models.Job, 2)
+        assert (job.status, job.processed, job.attempts) == ("pending", 0, 1)
+        assert "database is locked" in job.error
+        assert [job.id for job in crud.get_unfinished_jobs(db)] == [2]
+
+        jobs.run_job(TestingSessionLocal, 2)
+        db.expire_all()
+        job = db.get(models.Job, 2)
+        assert (job.status, job.processed) == ("done", 5)
+        assert db.query(models.Item).filter(models.Item.owner_id == 1).count() == 10
+    finally:
+        db.close()
+
+
+def test_run_job_claims_job_once(test_db, monkeypatch):
+    """複数のプロセスが同じジョブを再開しようとした場合のテスト。
+    - 他のワーカーが実行中 (最近進捗を記録している) のジョブは実行しないこと
+    - 他のワーカーの記録が JOB_CLAIM_TIMEOUT より古ければ引き継いで完了させること
+    - 実行中に担当を奪われた場合は、そのチャンクを取り消して処理を中止すること
+    """
+    monkeypatch.setattr(jobs, "REASSIGN_CHUNK_SIZE", 2)
+    monkeypatch.setattr(jobs, "REASSIGN_CHUNK_PAUSE", 0)
+
+    db = TestingSessionLocal()
+    try:
+        db.add_all([
+            models.User(id=1, email="a@example.com", hashed_password="x", token="a", is_active=True),
+            models.User(id=2, email="b@example.com", hashed_password="x", token="b", is_active=False),
+            models.User(id=3, email="c@example.com", hashed_password="x", token="c", is_active=False),
+        ])
+        db.add_all(models.Item(title=f"Task {i}", owner_id=2 if i < 5 else 3) for i in range(10))
+        db.add_all([
+            models.Job(
+                id=1, kind="reassign_items", status="running", user_id=2, new_owner_id=1, processed=0,
+                claimed_by="other", claimed_at=time.time(),
+            ),
+            models.Job(id=2, kind="reassign_items", status="pending", user_id=3, new_owner_id=1, processed=0),
+        ])
+        db.commit()
+
+        assert jobs.run_job(TestingSessionLocal, 1) is False
+        assert db.query(models.Item).filter(models.Item.owner_id == 2).count() == 5
+
+        db.query(models.Job).filter(models.Job.id == 1).update({"claimed_at": time.time() - jobs.JOB_CLAIM_TIMEOUT - 1})
+        db.commit()
+        assert jobs.run_job(TestingSessionLocal, 1) is True
+        db.expire_all()
+        job = db.get(models.Job, 1)
+        assert (job.status, job.processed, job.claimed_by) == ("done", 5, jobs.worker_id())
+
+        # 2チャンク目の処理中に他のワーカーが担当を引き継いだ場合
+        reassign_items_chunk = crud.reassign_items_chunk
+        calls = []
+
+        def stolen_reassign_items_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                other = TestingSessionLocal()
+                other.query(models.Job).filter(models.Job.id == 2).update({"claimed_by": "other"})
+                other.commit()
+                other.close()
+            return reassign_items_chunk(*args, **kwargs)
+
+        monkeypatch.setattr(crud, "reassign_items_chunk", stolen_reassign_items_chunk)
+        assert jobs.run_job(TestingSessionLocal, 2) is True
+        db.expire_all()
+        job = db.get(models.Job, 2)
+        assert (job.status, job.processed, job.claimed_by) == ("running", 2, "other")
+        assert db.query(models.Item).filter(models.Item.owner_id == 3).count() == 3
+    finally:
+        db.close()
+
+
+# レスポンス圧縮のテスト
+def test_response_compression(test_db, client, monkeypatch):
+    """レスポンス圧縮ミドルウェアのテスト。
+    - 閾値以上のレスポンスが Accept-Encoding に応じて gzip 圧縮されること
+    - 閾値未満のレスポンスや、圧縮を受け付けないリクエストは圧縮されないこと
+    - 同じ内容のレスポンスは圧縮結果のキャッシュが使われること
+    """
+    compress_calls = []
+    original_compress = compression.compress
+
+    def counting_compress(body, encoding, level):
+        compress_calls.append(encoding)
+        return original_compress(body, encoding, level)
+
+    monkeypatch.setattr(compression, "compress", counting_compress)
+
+    user = client.post("/users/", json={"email": "zip@example.com", "password": "abCD1234"}).json()
+    headers = {"X-API-TOKEN": user["token"]}
+
+    response = client.get("/items/", headers={**headers, "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+
+    for i in range(50):
+        client.post("/me/items/", json={"title": f"Task {i}", "description": "x" * 50}, headers=headers)
+
+    response = client.get("/items/", headers={**headers, "Accept-Encoding": "deflate, gzip;q=0.5"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["items"]) == 50
+
+    response = client.get("/items/", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert compress_calls == ["gzip"]
+
+    response = client.get("/items/", headers={**headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()["items"]) == 50
+
+
+# Idempotency-Key のテスト
+def test_idempotency_key(test_db, client):
+    """Idempotency-Key 付きの POST リクエストに対するテスト。
+    - 同じキーで再送したリクエストには保存済みのレスポンスが返却され、Item が重複して作成されないこと
+    - 同じキーで異なる内容のリクエストを送信した場合に異常系（status=422）のレスポンスが返却されること
+    - 同じキーのリクエストが同時に届いた場合も Item が1件だけ作成されること
+    """
+    user = client.post("/users/", json={"email": "retry@example.com", "password": "abCD1234"}).json()
+    headers = {"X-API-TOKEN": user["token"], "Idempotency-Key": "key-1"}
+
+    first = client.post("/me/items/", json={"title": "Task A"}, headers=headers)
+    assert first.status_code == 200
+    retry = client.post("/me/items/", json={"title": "Task A"}, headers=headers)
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+
+    conflict = client.post("/me/items/", json={"title": "Task B"}, headers=headers)
+    assert conflict.status_code == 422
+    assert conflict.json()["detail"] == "同じIdempotency-Keyで異なる内容のリクエストが送信されています。"
+
+    async def post_concurrently():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            return await asyncio.gather(*[
+                async_client.post(
+                    "/me/items/",
+                    json={"title": "Task C"},
+                    headers={"X-API-TOKEN": user["token"], "Idempotency-Key": "key-2"},
+                )
+                for _ in range(5)
+            ])
+
+    responses = asyncio.run(post_concurrently())
+    assert {response.json()["id"] for response in responses} == {2}
+
+    items = client.get("/me/items", headers={"X-API-TOKEN": user["token"]}).json()["items"]
+    assert [item["title"] for item in items] == ["Task A", "Task C"]
+
+
+def test_idempotency_concurrent_duplicate_with_slow_store():
+    """保存済みレスポンスの取得が遅い場合でも、同時に届いた同じキーのリクエストで書き込みが1回だけ実行されること。"""
+    calls = []
+    slow_app = FastAPI()
+
+    @slow_app.post("/me/items/")
+    async def create_item():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"id": len(calls)}
+
+    class SlowStore(idempotency.MemoryIdempotencyStore):
+        def __init__(self):
+            super().__init__()
+            self.get_calls = 0
+
+        def get(self, key):
+            # 2回目の取得は、先行リクエストの保存と完了をまたいでから結果を返す
+            stored = super().get(key)
+            self.get_calls += 1
+            if self.get_calls == 2:
+                time.sleep(0.2)
+            return stored
+
+    middleware = idempotency.IdempotencyMiddleware(slow_app, store=SlowStore())
+
+    async def post_concurrently():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            return await asyncio.gather(*[
+                async_client.post("/me/items/", json={}, headers={"Idempotency-Key": "slow"})
+                for _ in range(2)
+            ])
+
+    responses = asyncio.run(post_concurrently())
+    assert len(calls) == 1
+    assert [response.json() for response in responses] == [{"id": 1}, {"id": 1}]
+
+
+@pytest.mark.parametrize(
+    "store_factory",
+    [
+        pytest.param(lambda ttl: idempotency.MemoryIdempotencyStore(ttl=ttl), id="memory"),
+        pytest.param(lambda ttl: idempotency.SQLiteIdempotencyStore(TestingSessionLocal, ttl=ttl), id="sqlite"),
+    ],
+)
+def test_idempotency_store_ttl(test_db, store_factory):
+    """保存したレスポンスが取得でき、TTL を過ぎると取得できなくなること。"""
+    store = store_factory(60)
+    store.set("key", "fingerprint", 200, [("content-type", "application/json")], b"{}")
+    stored = store.get("key")
+    assert stored.status_code == 200
+    assert stored.headers == [("content-type", "application/json")]
+    assert stored.body == b"{}"
+
+    expired = store_factory(-1)
+    expired.set("key", "fingerprint", 200, [], b"{}")
+    assert expired.get("key") is None
+
+
+# スキーママイグレーションのテスト
+def test_migrations_upgrade_existing_db(tmp_path):
+    """create_all で作成された既存の DB に対するマイグレーションのテスト。
+    - 不足しているインデックスが追加され、バージョンが最新になること
+    - バージョンが最新の場合は SELECT 以外の SQL が実行されないこと
+    """
+    legacy_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR, hashed_password VARCHAR, token VARCHAR NOT NULL, is_active BOOLEAN)"))
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, title VARCHAR, description VARCHAR, owner_id INTEGER REFERENCES users (id))"))
+        conn.execute(text("INSERT INTO users (email, hashed_password, token, is_active) VALUES ('a@example.com', 'x', 'a', 1)"))
+
+    assert migrations.upgrade(legacy_engine) == migrations.LATEST_VERSION
+    inspector = inspect(legacy_engine)
+    assert "ix_users_token" in {index["name"] for index in inspector.get_indexes("users")}
+    assert "ix_items_owner_id_id" in {index["name"] for index in inspector.get_indexes("items")}
+    assert "jobs" in inspector.get_table_names()
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM users")).scalar() == 1
+
+    statements = []
+
+    @event.listens_for(legacy_engine, "before_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    assert migrations.upgrade(legacy_engine) == migrations.LATEST_VERSION
+    assert statements and all(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+    legacy_engine.dispose()
+
+
+def test_migrations_fresh_db_matches_models(tmp_path):
+    """空の DB にマイグレーションを適用した結果が、models.py の定義と同じテーブル・インデックスになること。"""
+    migrated_engine = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    models_engine = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    migrations.upgrade(migrated_engine)
+    models.Base.metadata.create_all(bind=models_engine)
+
+    def schema(target_engine):
+        inspector = inspect(target_engine)
+        return {
+            table: (
+                {column["name"] for column in inspector.get_columns(table)},
+                {(index["name"], tuple(index["column_names"]), bool(index["unique"])) for index in inspector.get_indexes(table)},
+            )
+            for table in inspector.get_table_names()
+        }
+
+    assert schema(migrated_engine) == schema(models_engine)
+    migrated_engine.dispose()
+    models_engine.dispose()
+
+
+def test_get_version_raises_unless_table_is_missing(tmp_path):
+    """schema_version テーブルがない場合のみ 0 を返し、それ以外のエラーは送出されること。"""
+    broken_engine = create_engine(f"sqlite:///{tmp_path / 'broken.db'}")
+    with broken_engine.connect() as conn:
+        assert migrations.get_version(conn) == 0
+
+    with broken_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE schema_version (unexpected INTEGER)"))
+    with broken_engine.connect() as conn:
+        with pytest.raises(DBAPIError):
+            migrations.get_version(conn)
+    with pytest.raises(DBAPIError):
+        migrations.upgrade(broken_engine)
+    broken_engine.dispose()
+
+
+def test_health_check_and_readiness(test_db, client):
+    """GET /health-check, GET /ready のエンドポイントに対するテスト。
+    - /health-check は DB の状態に関わらず正常系（status=200）のレスポンスが返却されること
+    - /ready はマイグレーションの適用前は status=503、適用後は status=200 のレスポンスが返却されること
+    """
+    response = client.get("/health-check")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "not ready", "schema_version": 0}
+
+    migrations.upgrade(test_engine)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "schema_version": migrations.LATEST_VERSION}
+
+
+def test_readiness_db_unreachable(test_db, client, monkeypatch):
+    """DB に接続できない場合、/ready がスキーマのバージョンではなく接続エラーとして status=503 を返却すること。"""
+    def raise_operational_error(conn):
+        raise OperationalError("SELECT version FROM schema_version", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(migrations, "get_version", raise_operational_error)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "not ready", "detail": "DBに接続できません。"}
+
+
+# 疑似データ投入のテスト
+def test_seed_and_scale_test(tmp_path):
+    """seed.seed, seed.scale_test のテスト。
+    - 指定した件数のユーザー・アイテムが追加され、既存のデータに続けて追加できること
+    - アイテムの所有者が ID の小さいユーザーに偏ること
+    - 投入後にインデックスが作成し直されていること
+    - スケールテストで各段階・各クエリの計測結果が返却されること
+    """
+    seed_engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    seed.seed(seed_engine, n_users=50, n_items=2000, skew=1.5, batch_size=300, rng=random.Random(0))
+    seed.seed(seed_engine, n_users=50, n_items=1000, skew=1.5, batch_size=300, rng=random.Random(1))
+
+    with seed_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM users")).scalar() == 100
+        assert conn.execute(text("SELECT count(*) FROM items")).scalar() == 3000
+        counts = dict(conn.execute(text("SELECT owner_id, count(*) FROM items GROUP BY owner_id")).all())
+    assert counts[1] == max(counts.values())
+    assert counts[1] > sum(counts.get(owner_id, 0) for owner_id in range(51, 101))
+
+    index_names = {index["name"] for index in inspect(seed_engine).get_indexes("items")}
+    assert {"ix_items_owner_id_id", "ix_items_title"} <= index_names
+    seed_engine.dispose()
+
+    scale_engine = create_engine(f"sqlite:///{tmp_path / 'scale.db'}")
+    rows = seed.scale_test(scale_engine, [10, 20], items_per_user=5, skew=1.1, repeat=1, rng=random.Random(0))
+    scale_engine.dispose()
+    assert {(n_users, n_items) for n_users, n_items, _, _ in rows} == {(10, 50), (20, 100)}
+    assert len(rows) == 2 * len({name for _, _, name, _ in rows})
+
+
+def test_compression_cache_is_not_shared_between_same_etags(test_db, client):
+    """同じパス・同じ ETag を持つ別ユーザーのレスポンスで、圧縮結果のキャッシュが共有されないこと。"""
+    etag_app = FastAPI()
+
+    @etag_app.get("/me/items/")
+    def read_own_items(user: str):
+        return Response(content=user.encode() * 2000, headers={"ETag": 'W/"3"'})
+
+    etag_client = TestClient(compression.CompressionMiddleware(etag_app, minimum_size=10))
+    for user in ("alice", "bob", "alice"):
+        response = etag_client.get("/me/items/", params={"user": user}, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == user.encode() * 2000
+
+
+def test_compression_of_large_body_runs_in_threadpool(monkeypatch):
+    """threadpool_min_size 以上の本文はイベントループのスレッドではなく、スレッドプールで圧縮されること。"""
+    compress_threads = []
+    original_compress = compression.compress
+
+    def recording_compress(body, encoding, level):
+        compress_threads.append((len(body), threading.get_ident()))
+        return original_compress(body, encoding, level)
+
+    monkeypatch.setattr(compression, "compress", recording_compress)
+
+    body_app = FastAPI()
+    loop_threads = []
+
+    @body_app.get("/body")
+    async def read_body(size: int):
+        loop_threads.append(threading.get_ident())
+        return Response(content=b"x" * size)
+
+    body_client = TestClient(compression.CompressionMiddleware(body_app, minimum_size=10, threadpool_min_size=1000))
+    for size in (100, 5000):
+        response = body_client.get("/body", params={"size": size}, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == b"x" * size
+
+    (small_size, small_thread), (large_size, large_thread) = compress_threads
+    assert (small_size, large_size) == (100, 5000)
+    assert small_thread == loop_threads[0]
+    assert large_thread != loop_threads[1]
+
+
+@pytest.mark.parametrize(
+    ["encoding", "module_name"],
+    [
+        pytest.param("br", "brotli", id="brotli"),
+        pytest.param("zstd", "zstandard", id="zstd"),
+    ],
+)
+def test_response_compression_optional_encodings(test_db, client, encoding, module_name):
+    """brotli / zstandard がインストールされている場合に、br / zstd で圧縮されること。"""
+    pytest.importorskip(module_name)
+
+    user = client.post("/users/", json={"email": "br@example.com", "password": "abCD1234"}).json()
+    headers = {"X-API-TOKEN": user["token"]}
+    for i in range(50):
+        client.post("/me/items/", json={"title": f"Task {i}", "description": "x" * 50}, headers=headers)
+
+    response = client.get("/items/", headers={**headers, "Accept-Encoding": f"gzip;q=0.5, {encoding}"})
+    assert response.headers["content-encoding"] == encoding
+    assert len(response.json()["items"]) == 50
+
+
+def test_seed_keeps_unique_and_auth_indexes_and_rebuilds_on_failure(tmp_path):
+    """疑似データ投入中のインデックスのテスト。
+    - 投入中もメールアドレスの一意制約とトークンのインデックスが残っていること
+    - 投入に失敗した場合も、削除したインデックスが作り直されること
+    """
+    seed_engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    migrations.upgrade(seed_engine)
+    expected = {table: {index["name"] for index in inspect(seed_engine).get_indexes(table)} for table in ("users", "items")}
+    indexes_during_load = {}
+
+    class FailingRandom(random.Random):
+        def choices(self, *args, **kwargs):
+            # Item の投入前に、その時点のインデックスを記録してから失敗させる
+            indexes_during_load.update(
+                {table: {index["name"] for index in inspect(seed_engine).get_indexes(table)} for table in ("users", "items")}
+            )
+            raise RuntimeError("interrupted")
+
+    with pytest.raises(RuntimeError):
+        seed.seed(seed_engine, n_users=10, n_items=100, rng=FailingRandom())
+
+    assert {"ix_users_email", "ix_users_token"} <= indexes_during_load["users"]
+    assert "ix_items_owner_id_id" not in indexes_during_load["items"]
+    assert {table: {index["name"] for index in inspect(seed_engine).get_indexes(table)} for table in ("users", "items")} == expected
+    seed_engine.dispose()